@@ -2,9 +2,9 @@
 # /// script
 # requires-python = ">=3.11"
 # dependencies = [
-#     "PyJWT",
-#     "requests",
+#     "urllib3",
 #     "cryptography",
+#     "orjson",
 # ]
 # ///
 """
@@ -17,6 +17,9 @@ Environment variables required:
 - GH_APP_ID: GitHub App ID
 - GH_APP_PRIVATE_KEY_PEM_B64: Base64-encoded private key
 
+Optional environment variables:
+- GH_APP_INSTALLATION_ID: Installation to use (defaults to the first one listed)
+
 Usage:
     # Run with uv (automatically installs dependencies)
     uv run get_github_app_token.py
@@ -29,43 +32,65 @@ Usage:
 """
 
 import base64
-import json
 import os
 import sys
+import tempfile
 import time
 from datetime import datetime, timezone
+from functools import lru_cache
 from pathlib import Path
 
-import jwt
-import requests
+import orjson
+
+# The JWT header never changes, so encode it once
+JWT_HEADER_B64 = base64.urlsafe_b64encode(b'{"alg":"RS256","typ":"JWT"}').rstrip(b'=')
 
 # Cache file location
-CACHE_FILE = Path("/tmp/gh_app_token_cache.json")
+CACHE_FILE = Path(os.environ.get("XDG_RUNTIME_DIR") or "/tmp") / "gh_app_token_cache.json"
 # Buffer time before expiration (5 minutes)
 EXPIRATION_BUFFER_SECONDS = 300
+# Timeouts for GitHub API calls, in seconds
+API_CONNECT_TIMEOUT = 10
+API_READ_TIMEOUT = 30
+
+
+def parse_expires_at(expires_at):
+    """Convert GitHub's ISO 8601 expiration time to a Unix timestamp."""
+    return int(datetime.fromisoformat(expires_at.replace('Z', '+00:00')).timestamp())
+
+
+def get_cache_key():
+    """Identify the app and installation a cached token was issued for."""
+    return f"{os.getenv('GH_APP_ID')}:{os.getenv('GH_APP_INSTALLATION_ID', '')}"
 
 
 def get_cached_token():
     """Get cached token if it exists and is still valid."""
-    if not CACHE_FILE.exists():
-        return None
-
     try:
-        with open(CACHE_FILE, 'r') as f:
-            cache_data = json.load(f)
+        with open(CACHE_FILE, 'rb') as f:
+            cache_data = orjson.loads(f.read())
+
+        # The cache may sit in a shared /tmp, so do not trust its shape
+        if not isinstance(cache_data, dict):
+            print("Cache is malformed, generating new token", file=sys.stderr)
+            return None
 
         token = cache_data.get('token')
-        expires_at_str = cache_data.get('expires_at')
+        expires_at_epoch = cache_data.get('expires_at_epoch')
+        key = cache_data.get('key')
 
-        if not token or not expires_at_str:
+        # Caches from older versions of this script lack the key and epoch
+        # fields; they are regenerated rather than migrated
+        if not token or not isinstance(expires_at_epoch, (int, float)) or key is None:
+            print("Cache is incomplete or from an older format, generating new token", file=sys.stderr)
             return None
 
-        # Parse expiration time (GitHub returns ISO 8601 format)
-        expires_at = datetime.fromisoformat(expires_at_str.replace('Z', '+00:00'))
-        now = datetime.now(timezone.utc)
+        if key != get_cache_key():
+            print("Cached token is for another app or installation, generating new token", file=sys.stderr)
+            return None
 
         # Check if token is still valid (with buffer)
-        time_until_expiry = (expires_at - now).total_seconds()
+        time_until_expiry = expires_at_epoch - time.time()
 
         if time_until_expiry > EXPIRATION_BUFFER_SECONDS:
             print(f"Using cached token (expires in {int(time_until_expiry/60)} minutes)", file=sys.stderr)
@@ -74,39 +99,98 @@ def get_cached_token():
             print("Cached token expired or expiring soon, generating new token", file=sys.stderr)
             return None
 
-    except (json.JSONDecodeError, ValueError, KeyError) as e:
+    except FileNotFoundError:
+        return None
+    except (orjson.JSONDecodeError, ValueError, KeyError) as e:
         print(f"Error reading cache: {e}, generating new token", file=sys.stderr)
         return None
 
 
 def save_token_to_cache(token, expires_at):
     """Save token and expiration to cache file."""
-    cache_data = {
-        'token': token,
-        'expires_at': expires_at,
-        'cached_at': datetime.now(timezone.utc).isoformat()
-    }
-
+    # Write to a temporary file and rename it so an interrupted write
+    # never leaves a truncated cache behind
+    tmp_file = None
     try:
-        with open(CACHE_FILE, 'w') as f:
-            json.dump(cache_data, f)
+        cache_data = {
+            'key': get_cache_key(),
+            'token': token,
+            'expires_at': expires_at,
+            'expires_at_epoch': parse_expires_at(expires_at),
+            'cached_at': datetime.now(timezone.utc).isoformat()
+        }
+
+        # mkstemp creates a fresh, unpredictably named file readable only by
+        # us, so nobody else can pre-create or redirect it in a shared /tmp
+        fd, tmp_name = tempfile.mkstemp(dir=CACHE_FILE.parent, prefix=CACHE_FILE.name + ".")
+        tmp_file = Path(tmp_name)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(orjson.dumps(cache_data))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_file, CACHE_FILE)
         print("Token cached successfully", file=sys.stderr)
     except Exception as e:
         print(f"Warning: Failed to cache token: {e}", file=sys.stderr)
+    finally:
+        if tmp_file is not None:
+            tmp_file.unlink(missing_ok=True)
+
+
+@lru_cache(maxsize=None)
+def load_private_key(private_key_b64):
+    """Decode and parse the PEM private key once per base64 value.
+
+    Parsing runs a costly RSA key check, so the key object is reused.
+    """
+    from cryptography.hazmat.primitives import serialization
+
+    pem_bytes = base64.b64decode(private_key_b64)
+    return serialization.load_pem_private_key(pem_bytes, password=None)
+
+
+def encode_jwt(payload, private_key):
+    """Build an RS256-signed JWT for the given payload."""
+    from cryptography.hazmat.primitives import hashes
+    from cryptography.hazmat.primitives.asymmetric import padding
+
+    payload_b64 = base64.urlsafe_b64encode(orjson.dumps(payload)).rstrip(b'=')
+    signing_input = JWT_HEADER_B64 + b'.' + payload_b64
+    signature = private_key.sign(signing_input, padding.PKCS1v15(), hashes.SHA256())
+    return (signing_input + b'.' + base64.urlsafe_b64encode(signature).rstrip(b'=')).decode()
+
+
+def check_response(response):
+    """Raise an error if a GitHub API call did not succeed."""
+    if response.status >= 400:
+        raise RuntimeError(f"GitHub API returned {response.status}: {response.data.decode(errors='replace')}")
 
 
 def generate_installation_token():
     """Generate a new installation access token for the GitHub App."""
+    # Imported here so that cache hits never load the HTTP and crypto stacks
+    import urllib3
+
     # Get credentials from environment
     app_id = os.getenv("GH_APP_ID")
     private_key_b64 = os.getenv("GH_APP_PRIVATE_KEY_PEM_B64")
 
-    if not all([app_id, private_key_b64]):
+    if not app_id or not private_key_b64:
         print("Error: Missing GH_APP_ID or GH_APP_PRIVATE_KEY_PEM_B64", file=sys.stderr)
         sys.exit(1)
 
-    # Decode private key
-    private_key = base64.b64decode(private_key_b64).decode('utf-8')
+    installation_id = os.getenv("GH_APP_INSTALLATION_ID")
+    if installation_id:
+        try:
+            installation_id = int(installation_id)
+        except ValueError:
+            print(f"Error: Invalid GH_APP_INSTALLATION_ID: {installation_id}", file=sys.stderr)
+            sys.exit(1)
+    else:
+        installation_id = None
+
+    # Decode and parse private key
+    private_key = load_private_key(private_key_b64)
 
     # Generate JWT
     now = int(time.time())
@@ -115,30 +199,40 @@ def generate_installation_token():
         "exp": now + (10 * 60),
         "iss": app_id,
     }
-    jwt_token = jwt.encode(payload, private_key, algorithm="RS256")
+    jwt_token = encode_jwt(payload, private_key)
 
-    # Get installations
     headers = {
         "Authorization": f"Bearer {jwt_token}",
         "Accept": "application/vnd.github+json",
         "X-GitHub-Api-Version": "2022-11-28",
+        # urllib3 does not ask for compression by default, unlike requests
+        "Accept-Encoding": "gzip",
     }
 
-    response = requests.get("https://api.github.com/app/installations", headers=headers)
-    response.raise_for_status()
-    installations = response.json()
+    # Share one connection between both calls to avoid a second TLS handshake
+    timeout = urllib3.Timeout(connect=API_CONNECT_TIMEOUT, read=API_READ_TIMEOUT)
+    with urllib3.PoolManager(num_pools=1, maxsize=1, headers=headers, timeout=timeout) as http:
+        # Only list installations when none was specified
+        if installation_id is None:
+            response = http.request("GET", "https://api.github.com/app/installations")
+            check_response(response)
+            installations = orjson.loads(response.data)
 
-    if not installations:
-        print("Error: No installations found for this GitHub App", file=sys.stderr)
-        sys.exit(1)
+            if not installations:
+                print("Error: No installations found for this GitHub App", file=sys.stderr)
+                sys.exit(1)
+
+            installation_id = installations[0]['id']
 
-    # Create installation token
-    installation_id = installations[0]['id']
-    url = f"https://api.github.com/app/installations/{installation_id}/access_tokens"
-    response = requests.post(url, headers=headers)
-    response.raise_for_status()
+        # Create installation token
+        url = f"https://api.github.com/app/installations/{installation_id}/access_tokens"
+        response = http.request("POST", url)
+        if response.status == 404:
+            print(f"Error: Installation {installation_id} not found for this GitHub App", file=sys.stderr)
+            sys.exit(1)
+        check_response(response)
 
-    token_info = response.json()
+        token_info = orjson.loads(response.data)
 
     # Save to cache
     save_token_to_cache(token_info['token'], token_info['expires_at'])
@@ -148,7 +242,8 @@ def generate_installation_token():
 
 def get_token():
     """Get a valid token, either from cache or by generating a new one."""
-    # Try to get cached token first
+    # Try to get cached token first; a hit must not parse the key, sign a
+    # JWT or touch the network
     cached_token = get_cached_token()
     if cached_token:
         return cached_token